@@ -5,49 +5,314 @@
 @description: 创建会话
 """
 
+import math
 import os
+import socket
+import threading
+from typing import Optional, Tuple
+
 import requests
 from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection
 from urllib3.util.retry import Retry
 
 from swanlab.env import SwanLabEnv
 from swanlab.package import get_package_version
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 默认的重试配置
 DEFAULT_RETRY_TOTAL = 5
 DEFAULT_RETRY_BACKOFF_FACTOR = 0.5
+DEFAULT_RETRY_BACKOFF_MAX = 30.0
+# 默认的超时配置，单位秒
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+# 默认的连接池配置
+DEFAULT_POOL_CONNECTIONS = 20
+DEFAULT_POOL_MAXSIZE = 50
+# 需要重试的响应状态码
+_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+# 允许重试的请求方法
+_ALLOWED_METHODS = frozenset(("GET", "POST", "PUT", "DELETE", "PATCH"))
 
 
-def create_session() -> requests.Session:
+def _env(key: str, default, cast, positive: bool = False):
     """
-    创建一个带重试机制的会话
-    重试次数和backoff因子可以通过环境变量SWANLAB_RETRY_TOTAL和SWANLAB_RETRY_BACKOFF_FACTOR设置
-    :return: requests.Session
+    从环境变量读取配置并转换为cast类型，如果未设置、无效（包括inf、nan）或为负数则返回默认值
+    positive为True时，0同样视为无效
     """
-    # 从环境变量读取重试配置，如果未设置或无效则使用默认值
-    try:
-        retry_total = int(os.getenv(SwanLabEnv.RETRY_TOTAL.value, str(DEFAULT_RETRY_TOTAL)))
-        if retry_total < 0:
-            retry_total = DEFAULT_RETRY_TOTAL
-    except (ValueError, TypeError):
-        retry_total = DEFAULT_RETRY_TOTAL
-    
+    value = os.getenv(key)
+    if value is None:
+        return default
     try:
-        retry_backoff_factor = float(os.getenv(SwanLabEnv.RETRY_BACKOFF_FACTOR.value, str(DEFAULT_RETRY_BACKOFF_FACTOR)))
-        if retry_backoff_factor < 0:
-            retry_backoff_factor = DEFAULT_RETRY_BACKOFF_FACTOR
+        value = cast(value)
     except (ValueError, TypeError):
-        retry_backoff_factor = DEFAULT_RETRY_BACKOFF_FACTOR
-    
-    session = requests.Session()
-    retry = Retry(
-        total=retry_total,
-        backoff_factor=retry_backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE", "PATCH"]),
+        return default
+    if not math.isfinite(value) or value < 0 or (positive and value == 0):
+        return default
+    return value
+
+
+# 会话配置在模块导入时由_reload_config读取一次，避免每次创建会话时重复解析
+_RETRY_TOTAL: int = DEFAULT_RETRY_TOTAL
+_BACKOFF: float = DEFAULT_RETRY_BACKOFF_FACTOR
+_BACKOFF_MAX: float = DEFAULT_RETRY_BACKOFF_MAX
+_TIMEOUT: Tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_POOL_CONNECTIONS: int = DEFAULT_POOL_CONNECTIONS
+_POOL_MAXSIZE: int = DEFAULT_POOL_MAXSIZE
+_SDK_VERSION: str = get_package_version()
+# 重试策略在读取配置时创建，所有adapter共用
+_RETRY: Optional["CappedRetry"] = None
+
+# 进程内共享的adapter，连接池保存在adapter中
+# 会话本身携带cookie、hooks等调用方状态，不能共享，但所有会话挂载同一个adapter，从而复用连接
+_ADAPTER: Optional[HTTPAdapter] = None
+_LOCK = threading.Lock()
+
+
+def _orjson_compatible(obj) -> bool:
+    """
+    判断obj能否交给orjson序列化，且结果与requests自带的json序列化一致
+    orjson会将NaN和Infinity序列化为null，而requests会直接报错；numpy标量等非标准类型orjson默认无法序列化
+    遇到这些值时返回False，直接使用requests自带的序列化，避免重复序列化
+    """
+    if obj is None or isinstance(obj, (str, int)):
+        return True
+    if type(obj) is float:
+        return math.isfinite(obj)
+    if isinstance(obj, dict):
+        return all(_orjson_compatible(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return all(_orjson_compatible(v) for v in obj)
+    return False
+
+
+class CappedRetry(Retry):
+    """
+    单次等待时间有上限的重试策略
+    服务端返回的Retry-After可能非常大，直接遵守会使上传线程长时间阻塞，因此与backoff时间一同限制在_BACKOFF_MAX以内
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, _BACKOFF_MAX)
+
+    def get_backoff_time(self):
+        return min(super().get_backoff_time(), _BACKOFF_MAX)
+
+
+def _keepalive_socket_options() -> list:
+    """
+    TCP keep-alive相关的socket选项
+    仅开启SO_KEEPALIVE时，系统默认空闲7200秒后才发送探测包，远长于常见NAT、负载均衡的空闲超时
+    因此在平台支持时同时缩短空闲时间、探测间隔和探测次数
+    """
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # macOS上没有TCP_KEEPIDLE，对应的选项为TCP_KEEPALIVE
+    idle = getattr(socket, "TCP_KEEPIDLE", None) or getattr(socket, "TCP_KEEPALIVE", None)
+    if idle is not None:
+        options.append((socket.IPPROTO_TCP, idle, 60))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 5))
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    开启TCP keep-alive的adapter，连接空闲60秒后开始探测，避免空闲连接被NAT、负载均衡等中间设备静默断开，
+    以及对端失联后连接池中长期留存失效的连接
+    urllib3默认的socket选项已经包含TCP_NODELAY，这里在其基础上追加keep-alive相关选项
+    """
+
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + _keepalive_socket_options()
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", self.SOCKET_OPTIONS)
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs.setdefault("socket_options", self.SOCKET_OPTIONS)
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
+class SwanLabSession(requests.Session):
+    """
+    swanlab使用的会话
+    未指定timeout（或timeout为None）的请求使用默认的(连接超时, 读取超时)，避免后端无响应时请求一直阻塞
+    如果安装了orjson，且请求体只包含标准json类型，使用orjson序列化json请求体，否则使用requests自带的json序列化
+    两种方式的序列化结果一致，是否安装orjson不影响请求体的含义，详见_orjson_compatible
+    """
+
+    def request(
+        self,
+        method,
+        url,
+        params=None,
+        data=None,
+        headers=None,
+        cookies=None,
+        files=None,
+        auth=None,
+        timeout=None,
+        allow_redirects=True,
+        proxies=None,
+        hooks=None,
+        stream=None,
+        verify=None,
+        cert=None,
+        json=None,
+    ):
+        if timeout is None:
+            timeout = _TIMEOUT
+        if orjson is not None and json is not None and not data and _orjson_compatible(json):
+            try:
+                data = orjson.dumps(json)
+            except TypeError:
+                pass
+            else:
+                json = None
+                headers = CaseInsensitiveDict(headers or {})
+                headers.setdefault("Content-Type", "application/json")
+        return super().request(
+            method,
+            url,
+            params=params,
+            data=data,
+            headers=headers,
+            cookies=cookies,
+            files=files,
+            auth=auth,
+            timeout=timeout,
+            allow_redirects=allow_redirects,
+            proxies=proxies,
+            hooks=hooks,
+            stream=stream,
+            verify=verify,
+            cert=cert,
+            json=json,
+        )
+
+    def close(self):
+        """
+        关闭会话，共享的adapter不会被关闭，以免影响其他会话正在使用的连接池
+        """
+        for adapter in self.adapters.values():
+            if adapter is not _ADAPTER:
+                adapter.close()
+
+
+def _reload_config():
+    """
+    重新从环境变量读取会话配置并重置共享的adapter
+    主要用于测试中修改环境变量后使其生效
+    """
+    global _RETRY_TOTAL, _BACKOFF, _BACKOFF_MAX, _TIMEOUT, _POOL_CONNECTIONS, _POOL_MAXSIZE, _RETRY
+    _RETRY_TOTAL = _env(SwanLabEnv.RETRY_TOTAL.value, DEFAULT_RETRY_TOTAL, int)
+    _BACKOFF = _env(SwanLabEnv.RETRY_BACKOFF_FACTOR.value, DEFAULT_RETRY_BACKOFF_FACTOR, float)
+    _BACKOFF_MAX = _env(SwanLabEnv.RETRY_BACKOFF_MAX.value, DEFAULT_RETRY_BACKOFF_MAX, float)
+    _TIMEOUT = (
+        _env(SwanLabEnv.CONNECT_TIMEOUT.value, DEFAULT_CONNECT_TIMEOUT, float, positive=True),
+        _env(SwanLabEnv.READ_TIMEOUT.value, DEFAULT_READ_TIMEOUT, float, positive=True),
+    )
+    _POOL_CONNECTIONS = _env(SwanLabEnv.POOL_CONNECTIONS.value, DEFAULT_POOL_CONNECTIONS, int, positive=True)
+    _POOL_MAXSIZE = _env(SwanLabEnv.POOL_MAXSIZE.value, DEFAULT_POOL_MAXSIZE, int, positive=True)
+    # 状态码重试耗尽后返回最后一次的响应而不是抛出RetryError，由调用方根据状态码处理
+    _RETRY = CappedRetry(
+        total=_RETRY_TOTAL,
+        backoff_factor=_BACKOFF,
+        status_forcelist=_STATUS_FORCELIST,
+        allowed_methods=_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    reset_session()
+
+
+def _create_adapter() -> HTTPAdapter:
+    """
+    根据会话配置创建带重试机制的adapter
+    """
+    return KeepAliveAdapter(
+        max_retries=_RETRY,
+        pool_connections=_POOL_CONNECTIONS,
+        pool_maxsize=_POOL_MAXSIZE,
+        pool_block=True,
+    )
+
+
+def _get_adapter() -> HTTPAdapter:
+    """
+    获取进程内共享的adapter，首次调用时创建
+    """
+    global _ADAPTER
+    adapter = _ADAPTER
+    if adapter is None:
+        with _LOCK:
+            adapter = _ADAPTER
+            if adapter is None:
+                adapter = _ADAPTER = _create_adapter()
+    return adapter
+
+
+def reset_session():
+    """
+    重置共享的adapter并关闭其中的连接，下次创建会话时将重新创建
+    """
+    global _ADAPTER
+    with _LOCK:
+        if _ADAPTER is not None:
+            _ADAPTER.close()
+        _ADAPTER = None
+
+
+def _reset_after_fork():
+    """
+    fork后的子进程中丢弃从父进程继承的adapter，避免与父进程共用同一个keep-alive连接
+    不关闭继承的连接，以免影响父进程；同时重建锁，防止fork时其他线程持有锁导致死锁
+    """
+    global _ADAPTER, _LOCK
+    _ADAPTER = None
+    _LOCK = threading.Lock()
+
+
+def create_session() -> SwanLabSession:
+    """
+    创建一个带重试机制的会话，所有会话共享同一个连接池
+    重试次数和backoff因子可以通过环境变量SWANLAB_RETRY_TOTAL和SWANLAB_RETRY_BACKOFF_FACTOR设置
+    单次重试的最长等待时间可以通过环境变量SWANLAB_RETRY_BACKOFF_MAX设置
+    默认超时时间可以通过环境变量SWANLAB_CONNECT_TIMEOUT和SWANLAB_READ_TIMEOUT设置
+    连接池大小可以通过环境变量SWANLAB_POOL_CONNECTIONS和SWANLAB_POOL_MAXSIZE设置
+    环境变量在模块导入时读取，之后的修改不会生效
+    调用方拥有返回的会话，可以自由修改cookie、headers、hooks或关闭它；
+    但连接池归模块所有，关闭会话不会关闭共享的连接池，只有reset_session会关闭它
+    :return: SwanLabSession
+    """
+    session = SwanLabSession()
+    # http与https共用同一个adapter，从而共享连接池
+    adapter = _get_adapter()
     session.mount("https://", adapter)
     session.mount("http://", adapter)
-    session.headers["swanlab-sdk"] = get_package_version()
+    # Accept-Encoding固定为gzip和deflate，不随本地是否安装brotli、zstandard而变化
+    session.headers.update(
+        {
+            "swanlab-sdk": _SDK_VERSION,
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate",
+        }
+    )
     return session
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+_reload_config()
@@ -141,6 +141,26 @@ class SwanLabEnv(enum.Enum):
     """
     HTTP请求重试的backoff因子，默认为0.5
     """
+    RETRY_BACKOFF_MAX = "SWANLAB_RETRY_BACKOFF_MAX"
+    """
+    HTTP请求单次重试的最长等待时间（包括服务端Retry-After要求的等待时间），单位秒，默认为30
+    """
+    CONNECT_TIMEOUT = "SWANLAB_CONNECT_TIMEOUT"
+    """
+    HTTP请求建立连接的默认超时时间，单位秒，默认为5
+    """
+    READ_TIMEOUT = "SWANLAB_READ_TIMEOUT"
+    """
+    HTTP请求等待响应的默认超时时间，单位秒，默认为30
+    """
+    POOL_CONNECTIONS = "SWANLAB_POOL_CONNECTIONS"
+    """
+    HTTP连接池缓存的连接池数量（按host区分），默认为20
+    """
+    POOL_MAXSIZE = "SWANLAB_POOL_MAXSIZE"
+    """
+    单个HTTP连接池中保存的最大连接数，默认为50
+    """
 
     @staticmethod
     def is_hostname(value: str) -> bool:
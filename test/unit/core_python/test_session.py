@@ -5,15 +5,32 @@
 @description: $END$
 """
 
+import json
 import os
+import socket
+
 import pytest
+import requests
 import responses
 from responses import registries
+from urllib3 import HTTPResponse
 
+import swanlab.core_python.session as session_module
 from swanlab.core_python import create_session
+from swanlab.core_python.session import _reload_config, reset_session
 from swanlab.package import get_package_version
 
 
+@pytest.fixture(autouse=True)
+def fresh_adapter():
+    """
+    每个测试前后重新读取会话配置并重置共享的adapter
+    """
+    _reload_config()
+    yield
+    _reload_config()
+
+
 @pytest.mark.parametrize("url", ["https://api.example.com/retry", "http://api.example.com/retry"])
 @responses.activate(registry=registries.OrderedRegistry)
 def test_retry(url):
@@ -62,6 +79,8 @@ def test_session_headers():
 
     # 验证User-Agent等默认头也存在（可选）
     assert "User-Agent" in captured_headers
+    assert captured_headers["Connection"] == "keep-alive"
+    assert captured_headers["Accept-Encoding"] == "gzip, deflate"
 
     # 打印所有捕获的请求头（调试用）
     print("\n捕获的请求头:", captured_headers)
@@ -125,7 +144,8 @@ def test_retry_with_custom_env_variables():
             responses.add(responses.GET, test_url, body="Error", status=500)
         responses.add(responses.GET, test_url, body="Success", status=200)
         
-        # 创建会话并请求
+        # 重新读取环境变量，创建会话并请求
+        _reload_config()
         s = create_session()
         resp = s.get(test_url)
         
@@ -166,7 +186,8 @@ def test_retry_default_values_without_env():
             responses.add(responses.GET, test_url, body="Error", status=500)
         responses.add(responses.GET, test_url, body="Success", status=200)
         
-        # 创建会话并请求
+        # 重新读取环境变量，创建会话并请求
+        _reload_config()
         s = create_session()
         resp = s.get(test_url)
         
@@ -207,7 +228,8 @@ def test_retry_invalid_env_values_fallback_to_defaults():
             responses.add(responses.GET, test_url, body="Error", status=500)
         responses.add(responses.GET, test_url, body="Success", status=200)
         
-        # 创建会话并请求
+        # 重新读取环境变量，创建会话并请求
+        _reload_config()
         s = create_session()
         resp = s.get(test_url)
         
@@ -225,3 +247,285 @@ def test_retry_invalid_env_values_fallback_to_defaults():
             os.environ.pop("SWANLAB_RETRY_BACKOFF_FACTOR", None)
         else:
             os.environ["SWANLAB_RETRY_BACKOFF_FACTOR"] = original_retry_backoff
+
+
+def test_pool_default_values_without_env(monkeypatch):
+    """
+    测试未设置环境变量时连接池使用默认值
+    """
+    monkeypatch.delenv("SWANLAB_POOL_CONNECTIONS", raising=False)
+    monkeypatch.delenv("SWANLAB_POOL_MAXSIZE", raising=False)
+    _reload_config()
+    s = create_session()
+    adapter = s.get_adapter("https://api.example.com")
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 50
+    assert adapter.poolmanager.connection_pool_kw["block"] is True
+    assert adapter.poolmanager.pools._maxsize == 20
+    # http与https共用同一个adapter
+    assert s.get_adapter("http://api.example.com") is adapter
+
+
+@pytest.mark.parametrize(
+    "connections, maxsize, expected",
+    [("8", "16", (8, 16)), ("invalid", "-1", (20, 50)), ("0", "not_a_number", (20, 50))],
+)
+def test_pool_with_custom_env_variables(monkeypatch, connections, maxsize, expected):
+    """
+    测试通过环境变量设置连接池大小，无效值回退到默认值
+    """
+    monkeypatch.setenv("SWANLAB_POOL_CONNECTIONS", connections)
+    monkeypatch.setenv("SWANLAB_POOL_MAXSIZE", maxsize)
+    _reload_config()
+    s = create_session()
+    adapter = s.get_adapter("https://api.example.com")
+    assert adapter.poolmanager.pools._maxsize == expected[0]
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == expected[1]
+
+
+def test_sessions_share_adapter():
+    """
+    测试多个会话共享同一个adapter（连接池），但会话状态互相独立
+    """
+    s1, s2 = create_session(), create_session()
+    assert s1 is not s2
+    assert s1.get_adapter("https://api.example.com") is s2.get_adapter("https://api.example.com")
+    s1.cookies.update({"sid": "test"})
+    assert "sid" not in s2.cookies
+    reset_session()
+    s3 = create_session()
+    assert s3.get_adapter("https://api.example.com") is not s1.get_adapter("https://api.example.com")
+
+
+def test_env_read_once(monkeypatch):
+    """
+    测试环境变量只在读取配置时解析一次，之后的修改不影响新建的会话
+    """
+    monkeypatch.setenv("SWANLAB_POOL_MAXSIZE", "8")
+    s1 = create_session()
+    assert s1.get_adapter("https://api.example.com").poolmanager.connection_pool_kw["maxsize"] == 50
+    _reload_config()
+    s2 = create_session()
+    assert s2.get_adapter("https://api.example.com").poolmanager.connection_pool_kw["maxsize"] == 8
+
+
+def test_keep_alive_socket_options():
+    """
+    测试连接开启了TCP_NODELAY和TCP keep-alive，并在平台支持时缩短了探测时间
+    """
+    s = create_session()
+    adapter = s.get_adapter("https://api.example.com")
+    options = adapter.poolmanager.connection_pool_kw["socket_options"]
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in options
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        assert (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60) in options
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        assert (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10) in options
+    if hasattr(socket, "TCP_KEEPCNT"):
+        assert (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 5) in options
+    proxy_manager = adapter.proxy_manager_for("http://proxy.example.com:8080")
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in proxy_manager.connection_pool_kw["socket_options"]
+
+
+@pytest.mark.parametrize("backoff_max, expected", [(None, 30), ("5", 5), ("invalid", 30), ("inf", 30), ("nan", 30)])
+def test_retry_after_capped(monkeypatch, backoff_max, expected):
+    """
+    测试服务端返回的Retry-After与backoff时间被限制在SWANLAB_RETRY_BACKOFF_MAX以内
+    """
+    if backoff_max is None:
+        monkeypatch.delenv("SWANLAB_RETRY_BACKOFF_MAX", raising=False)
+    else:
+        monkeypatch.setenv("SWANLAB_RETRY_BACKOFF_MAX", backoff_max)
+    monkeypatch.setenv("SWANLAB_RETRY_BACKOFF_FACTOR", "100")
+    _reload_config()
+    retry = create_session().get_adapter("https://api.example.com").max_retries
+    assert retry.get_retry_after(HTTPResponse(status=429, headers={"Retry-After": "3600"})) == expected
+    assert retry.get_retry_after(HTTPResponse(status=429, headers={"Retry-After": "1"})) == 1
+    assert retry.get_retry_after(HTTPResponse(status=429)) is None
+    # 增加重试次数后backoff时间同样被限制
+    retry = retry.increment("GET", "/").increment("GET", "/")
+    assert retry.get_backoff_time() == expected
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_retry_exhausted_returns_last_response(monkeypatch):
+    """
+    测试状态码重试耗尽后返回最后一次响应，而不是抛出异常
+    """
+    monkeypatch.setenv("SWANLAB_RETRY_TOTAL", "2")
+    _reload_config()
+    url = "https://api.example.com/retry-exhausted"
+    for _ in range(3):
+        responses.add(responses.GET, url, body="Error", status=503)
+    resp = create_session().get(url)
+    assert resp.status_code == 503
+    assert len(responses.calls) == 3
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@responses.activate(registry=registries.OrderedRegistry)
+def test_json_body(monkeypatch, use_orjson):
+    """
+    测试json请求体的序列化，未安装orjson时使用requests自带的序列化
+    """
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(session_module, "orjson", None)
+    url = "https://api.example.com/json"
+    responses.add(responses.POST, url, body="OK", status=200)
+    payload = {"key": "loss", "data": [{"index": 1, "data": 0.5}], "name": "中文"}
+    resp = create_session().post(url, json=payload)
+    assert resp.status_code == 200
+    request = responses.calls[0].request
+    assert request.headers["Content-Type"] == "application/json"
+    assert json.loads(request.body) == payload
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_json_body_orjson_fallback():
+    """
+    测试orjson无法序列化时回退到requests自带的序列化，且不覆盖调用方传入的Content-Type
+    """
+    pytest.importorskip("orjson")
+    url = "https://api.example.com/json-fallback"
+    responses.add(responses.POST, url, body="OK", status=200)
+    responses.add(responses.POST, url, body="OK", status=200)
+    s = create_session()
+    # orjson默认不支持非字符串的键
+    s.post(url, json={1: "a"})
+    assert json.loads(responses.calls[0].request.body) == {"1": "a"}
+    s.post(url, json={"a": 1}, headers={"content-type": "application/json; charset=utf-8"})
+    assert responses.calls[1].request.headers["Content-Type"] == "application/json; charset=utf-8"
+
+
+@pytest.mark.parametrize(
+    "connect, read, expected",
+    [(None, None, (5, 30)), ("1.5", "10", (1.5, 10)), ("0", "invalid", (5, 30)), ("inf", "inf", (5, 30))],
+)
+@responses.activate(registry=registries.OrderedRegistry)
+def test_default_timeout(monkeypatch, connect, read, expected):
+    """
+    测试未指定timeout的请求使用默认超时时间，显式传入的timeout不受影响
+    """
+    for key, value in (("SWANLAB_CONNECT_TIMEOUT", connect), ("SWANLAB_READ_TIMEOUT", read)):
+        if value is None:
+            monkeypatch.delenv(key, raising=False)
+        else:
+            monkeypatch.setenv(key, value)
+    _reload_config()
+    url = "https://api.example.com/timeout"
+    responses.add(responses.GET, url, body="OK", status=200)
+    responses.add(responses.GET, url, body="OK", status=200)
+    s = create_session()
+    s.get(url)
+    assert responses.calls[0].request.req_kwargs["timeout"] == expected
+    s.get(url, timeout=20)
+    assert responses.calls[1].request.req_kwargs["timeout"] == 20
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_request_positional_arguments():
+    """
+    测试以位置参数传入data、timeout等参数时不会与默认值冲突
+    """
+    url = "https://api.example.com/positional"
+    responses.add(responses.POST, url, body="OK", status=200)
+    s = create_session()
+    # method, url, params, data, headers, cookies, files, auth, timeout
+    resp = s.request("POST", url, None, b"raw", None, None, None, None, 7)
+    assert resp.status_code == 200
+    request = responses.calls[0].request
+    assert request.body == b"raw"
+    assert request.req_kwargs["timeout"] == 7
+
+
+def test_close_session_keeps_shared_pool():
+    """
+    测试关闭一个会话不会关闭其他会话共享的连接池
+    """
+    s1 = create_session()
+    adapter = s1.get_adapter("https://api.example.com")
+    pool = adapter.poolmanager.connection_from_url("https://api.example.com")
+    with create_session() as s2:
+        assert s2.get_adapter("https://api.example.com") is adapter
+    s2.close()
+    assert len(adapter.poolmanager.pools) == 1
+    assert adapter.poolmanager.connection_from_url("https://api.example.com") is pool
+    # 非共享的adapter仍然随会话关闭
+    s3 = create_session()
+    own_adapter = session_module.KeepAliveAdapter()
+    s3.mount("https://own.example.com", own_adapter)
+    own_adapter.poolmanager.connection_from_url("https://own.example.com")
+    s3.close()
+    assert len(own_adapter.poolmanager.pools) == 0
+    assert len(adapter.poolmanager.pools) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_resets_shared_adapter():
+    """
+    测试fork后的子进程不会复用父进程的adapter（及其中的连接）
+    """
+    parent_adapter = create_session().get_adapter("https://api.example.com")
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # 子进程：将比较结果写入管道后立即退出，不执行pytest的清理逻辑
+        try:
+            child_adapter = create_session().get_adapter("https://api.example.com")
+            ok = child_adapter is not parent_adapter and child_adapter is create_session().get_adapter("https://api.example.com")
+            os.write(write_fd, b"1" if ok else b"0")
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        result = f.read()
+    os.waitpid(pid, 0)
+    assert result == b"1"
+    assert create_session().get_adapter("https://api.example.com") is parent_adapter
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), -float("inf")])
+@responses.activate(registry=registries.OrderedRegistry)
+def test_json_body_non_finite(monkeypatch, use_orjson, value):
+    """
+    测试NaN和Infinity无论是否安装orjson都与requests的行为一致（报错），而不是被序列化为null
+    """
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(session_module, "orjson", None)
+    url = "https://api.example.com/json-nan"
+    responses.add(responses.POST, url, body="OK", status=200)
+    with pytest.raises(requests.exceptions.InvalidJSONError):
+        create_session().post(url, json={"data": [{"index": 1, "data": value}]})
+    assert len(responses.calls) == 0
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_json_body_skip_orjson_for_unsupported_types(monkeypatch):
+    """
+    测试请求体包含numpy标量等非标准类型时直接使用requests的序列化，不会先尝试orjson
+    """
+    np = pytest.importorskip("numpy")
+    orjson = pytest.importorskip("orjson")
+    calls = []
+
+    class CountingOrjson:
+        @staticmethod
+        def dumps(obj):
+            calls.append(obj)
+            return orjson.dumps(obj)
+
+    monkeypatch.setattr(session_module, "orjson", CountingOrjson)
+    url = "https://api.example.com/json-numpy"
+    responses.add(responses.POST, url, body="OK", status=200)
+    responses.add(responses.POST, url, body="OK", status=200)
+    s = create_session()
+    s.post(url, json={"data": np.float64(0.5)})
+    assert calls == []
+    assert json.loads(responses.calls[0].request.body) == {"data": 0.5}
+    s.post(url, json={"data": [0.5, 1, "a", None, True]})
+    assert len(calls) == 1